@@ -1,9 +1,25 @@
+import re
+import json
+import gzip
+import hashlib
 import subprocess
+import socket
+import threading
 import time
 import logging
-from flask import Flask, render_template_string, jsonify, request
-from datetime import datetime
+from functools import lru_cache
 from collections import deque
+from flask import Flask, Response, jsonify, request
+
+try:
+    import orjson          # optional C JSON encoder — falls back to stdlib json
+except ImportError:
+    orjson = None
+
+try:
+    import waitress        # optional production WSGI server — falls back to app.run
+except ImportError:
+    waitress = None
 
 app = Flask(__name__)
 
@@ -12,20 +28,38 @@ ROUTER_IP = "10.0.0.1"
 INTERFACE = "eth0"        # WAN
 LAN_INTERFACE = "br-lan"  # For Traffic Analysis
 CPU_CORES = 4             # ARMv7 quad-core — used to normalise load average to 0-100 %
-
-# Enhanced state tracking
-last_state = {
-    "rx_bytes": 0,
-    "tx_bytes": 0,
-    "time": time.time()
-}
-
-# Debug log storage (keep last 25 entries)
-debug_logs = deque(maxlen=25)
+SSH_CONTROL_PATH = "/tmp/nm-%r@%h:%p"  # ControlMaster socket — later ssh calls reuse one session
+DEVICE_CACHE_TTL = 20     # seconds — DHCP leases / station lists change on the order of minutes
+UPTIME_CACHE_TTL = 30     # seconds — the dashboard shows uptime to the minute
+PROCESS_CACHE_TTL = 5     # seconds — memory ranking barely moves between polls
+IFTOP_CACHE_TTL = 10      # seconds — per-flow rates are noisy; no need to sample every poll
+POLL_INTERVAL = 2.5       # seconds between background router polls
+STREAM_FULL_SYNC = 30     # seconds between full snapshots on a stream of patches
+MAX_STREAMS = 6           # open dashboards served over SSE; more get 503 and poll /api/stats
+SERVER_THREADS = MAX_STREAMS + 4  # waitress pool: every stream pins a thread, the rest serve requests
+
+# Recent WAN counter samples as (monotonic_time, rx_bytes, tx_bytes); rates
+# are taken across the whole window so one late poll doesn't spike the graph
+wan_samples = deque(maxlen=4)
+
+# Slow-changing poll sections: name -> (monotonic fetched_at, value), reused until the
+# section's TTL runs out.  Filled by the poller; actions may drop an entry to
+# force a refetch.
+_section_cache = {}
 
 # Uptime tracking
 start_time = time.time()
 
+# Latest result of get_router_data() as a Snapshot, replaced wholesale by the
+# poller thread — readers just grab the reference, so no lock is needed.
+# Set by publish_snapshot() once the encoder is defined.
+_snapshot = None
+# Notified on every publish so stream clients wake up instead of polling
+_snapshot_ready = threading.Condition()
+
+# One slot per open /api/stream; held for the life of the connection
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,7 +68,8 @@ logger = logging.getLogger(__name__)
 # TRAFFIC CLASSIFICATION
 # ---------------------------------------------------------------------------
 # Well-known destination IPs / ranges mapped to service names.
-# Checked in order — first match wins.
+# Compiled into a prefix trie below — the most specific (longest) prefix wins,
+# so list order doesn't matter.  Each prefix should appear only once.
 IP_SERVICE_MAP = [
     # YouTube
     ("142.250.",  "youtube"),
@@ -46,11 +81,7 @@ IP_SERVICE_MAP = [
     ("54.148.",   "netflix"),
     ("52.44.",    "netflix"),
     ("23.171.",   "netflix"),
-    # Google (generic, after youtube so YT wins first)
-    ("142.250.",  "google"),
-    ("172.217.",  "google"),
-    ("173.194.",  "google"),
-    ("216.58.",   "google"),
+    # Google (142.250. / 172.217. / 173.194. / 216.58. are shared with YouTube above)
     ("142.251.",  "google"),
     # Facebook / Meta
     ("31.13.",    "facebook"),
@@ -71,8 +102,7 @@ IP_SERVICE_MAP = [
     # Discord
     ("162.159.",  "discord"),
     ("104.16.",   "discord"),
-    # Cloudflare (CDN — many sites ride on it)
-    ("104.16.",   "cloudflare"),
+    # Cloudflare (CDN — many sites ride on it; 104.16. is listed under Discord)
     ("104.17.",   "cloudflare"),
     ("104.18.",   "cloudflare"),
     ("104.19.",   "cloudflare"),
@@ -87,62 +117,142 @@ IP_SERVICE_MAP = [
     ("54.",       "amazon"),
     ("13.",       "amazon"),
     ("99.",       "amazon"),
-    # Microsoft / Azure
+    # Microsoft / Azure (52. is mostly AWS — listed under Amazon)
     ("20.",       "microsoft"),
     ("40.",       "microsoft"),
-    ("52.",       "microsoft"),
     # Apple
     ("17.",       "apple"),
 ]
 
 # Well-known ports → traffic-type label.  Checked after IP classification.
 PORT_SERVICE_MAP = {
-    "443":  "HTTPS",
-    "80":   "HTTP",
-    "22":   "SSH",
-    "53":   "DNS",
-    "8443": "HTTPS",
-    "8080": "HTTP",
-    "993":  "IMAIL",
-    "587":  "SMTP",
-    "25":   "SMTP",
-    "21":   "FTP",
-    "3389": "RDP",
-    "5000": "MONITOR",
+    443:  "HTTPS",
+    80:   "HTTP",
+    22:   "SSH",
+    53:   "DNS",
+    8443: "HTTPS",
+    8080: "HTTP",
+    993:  "IMAIL",
+    587:  "SMTP",
+    25:   "SMTP",
+    21:   "FTP",
+    3389: "RDP",
+    5000: "MONITOR",
 }
 
 
+def _build_service_trie(service_map):
+    """
+    Multibit trie over IP_SERVICE_MAP with one 8-bit stride (dict level) per
+    octet; a node's service lives under the None key.  Lookups return the
+    longest matching prefix, so "52.85." beats "52." regardless of list order.
+    A prefix mapped to two services keeps the first and logs a warning.
+    """
+    root = {}
+    for prefix, service in service_map:
+        node = root
+        for octet in prefix.rstrip('.').split('.'):
+            node = node.setdefault(octet, {})
+        if node.get(None, service) != service:
+            logger.warning(f"IP_SERVICE_MAP: {prefix} already maps to {node[None]}, ignoring {service}")
+        node.setdefault(None, service)
+    return root
+
+
+_SERVICE_TRIE = _build_service_trie(IP_SERVICE_MAP)
+
+# (label, css_class) per service / port, built once instead of per iftop row
+_SERVICE_RESULTS = {service: (service.upper(), f"svc-{service}") for _, service in IP_SERVICE_MAP}
+_PORT_RESULTS = {port: (label, f"proto-{label.lower()}") for port, label in PORT_SERVICE_MAP.items()}
+
+
+def lookup_service(ip):
+    """Longest-prefix match of a dotted-quad IP in the service trie, or None."""
+    node, found = _SERVICE_TRIE, None
+    for octet in ip.split('.'):
+        node = node.get(octet)
+        if node is None:
+            break
+        found = node.get(None, found)
+    return found
+
+
+# Long-lived flows show up in poll after poll, so repeats are one cache hit
+@lru_cache(maxsize=1024)
 def classify_connection(dst_ip, dst_port):
     """
     Return (label, css_class).
     Strategy:
-      1. Try IP-range map for known services (YouTube, Netflix, etc.)
+      1. Try IP-range trie for known services (YouTube, Netflix, etc.)
       2. Fall back to port-based protocol label (HTTPS, SSH, etc.)
       3. Default to UNKNOWN
     """
-    # --- IP-based service detection ---
-    for prefix, service in IP_SERVICE_MAP:
-        if dst_ip.startswith(prefix):
-            return service.upper(), f"svc-{service}"
+    # --- IP-based service detection (at most 4 dict hops) ---
+    service = lookup_service(dst_ip)
+    if service:
+        return _SERVICE_RESULTS[service]
 
-    # --- Port-based protocol detection ---
-    label = PORT_SERVICE_MAP.get(dst_port, None)
-    if label:
-        return label, f"proto-{label.lower()}"
+    # --- Port-based protocol detection (dst_port is an int) ---
+    result = _PORT_RESULTS.get(dst_port)
+    if result:
+        return result
 
     # Last resort: show the port number itself
     return f"PORT {dst_port}", "proto-other"
 
 
+class DebugLog:
+    """
+    Fixed-size ring buffer of (time, level, message) entries.  The slots are
+    preallocated and overwritten in place; snapshot() hands out a cached
+    newest-first list of JSON-ready dicts that is only rebuilt after a write.
+    """
+    __slots__ = ("_buf", "_head", "_count", "_view", "_lock")
+
+    def __init__(self, size):
+        self._buf = [None] * size
+        self._head = 0          # slot the next entry goes into
+        self._count = 0
+        self._view = []
+        # append() runs on the poller thread and request threads;
+        # the lock only covers a few index updates, never any I/O.
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        with self._lock:
+            self._buf[self._head] = entry
+            self._head = (self._head + 1) % len(self._buf)
+            self._count = min(self._count + 1, len(self._buf))
+            self._view = None
+
+    def clear(self):
+        with self._lock:
+            self._buf = [None] * len(self._buf)
+            self._head = self._count = 0
+            self._view = []
+
+    def snapshot(self):
+        """Newest-first list of dicts — shared between callers, so treat it as read-only."""
+        view = self._view
+        if view is None:
+            with self._lock:
+                size = len(self._buf)
+                entries = (self._buf[(self._head - 1 - i) % size] for i in range(self._count))
+                view = self._view = [{"time": t, "level": lvl, "message": msg}
+                                     for t, lvl, msg in entries]
+        return view
+
+
+# Debug log storage (keep last 25 entries)
+debug_logs = DebugLog(25)
+
+
 def log_debug(level, message):
     """Add entry to debug log with timestamp"""
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    entry = {
-        "time": timestamp,
-        "level": level,
-        "message": message
-    }
-    debug_logs.append(entry)
+    # time.strftime + manual ms avoids building a datetime on every call
+    now = time.time()
+    timestamp = time.strftime("%H:%M:%S", time.localtime(now)) + f".{int(now % 1 * 1000):03d}"
+    debug_logs.append((timestamp, level, message))
     logger.info(f"[{level}] {message}")
 
 
@@ -155,7 +265,6 @@ HTML_TEMPLATE = """
 <head>
     <meta charset="UTF-8">
     <title>Network Monitor</title>
-    <script src="https://code.jquery.com/jquery-3.6.0.min.js"></script>
     <link rel="preconnect" href="https://fonts.googleapis.com">
     <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
@@ -779,6 +888,32 @@ HTML_TEMPLATE = """
     // --- Modal / Action state ---
     let pendingAction = null;   // 'flush-dhcp' | 'reboot'
 
+    // Elements written on every render, looked up once
+    const $id = id => document.getElementById(id);
+    const el = {
+        indicator: $id('connection-indicator'),
+        pingVal:   $id('ping-val'),
+        loadVal:   $id('load-val'),
+        loadFill:  $id('load-fill'),
+        tempVal:   $id('temp-val'),
+        tempFill:  $id('temp-fill'),
+        tempStatus: $id('temp-status'),
+        memVal:    $id('mem-val'),
+        download:  $id('download-speed'),
+        upload:    $id('upload-speed'),
+        total:     $id('total-speed'),
+        uptime:    $id('router-uptime'),
+        clock:     $id('clock'),
+        iftopBody: $id('iftop-body'),
+        connCount: $id('conn-count'),
+        procBody:  $id('proc-body'),
+        procCount: $id('proc-count'),
+        devices:   $id('devices-grid'),
+        devCount:  $id('device-count'),
+        debug:     $id('debug-console'),
+        debugCount: $id('debug-count')
+    };
+
     // ---- helpers ----
     function formatSpeed(mbps) { return parseFloat(mbps).toFixed(2); }
 
@@ -815,216 +950,485 @@ HTML_TEMPLATE = """
     function confirmAction(action) {
         pendingAction = action;
         const cfg = modalCfg[action];
-        $('#modal-title').text(cfg.title);
-        $('#modal-body').text(cfg.body);
-        $('#modal-confirm').attr('class', 'btn-confirm ' + cfg.confirmClass).text(cfg.confirmText);
-        $('#modal-overlay').addClass('show');
+        $id('modal-title').textContent = cfg.title;
+        $id('modal-body').textContent  = cfg.body;
+        const confirmBtn = $id('modal-confirm');
+        confirmBtn.className   = 'btn-confirm ' + cfg.confirmClass;
+        confirmBtn.textContent = cfg.confirmText;
+        $id('modal-overlay').classList.add('show');
     }
 
     function closeModal() {
-        $('#modal-overlay').removeClass('show');
+        $id('modal-overlay').classList.remove('show');
         pendingAction = null;
     }
 
     function executeAction() {
+        const action = pendingAction;   // closeModal() clears it
         closeModal();
-        if (!pendingAction) return;
-
-        const action = pendingAction;
-        pendingAction = null;
+        if (!action) return;
 
         // Disable the button while request is in-flight
-        const btnId   = action === 'flush-dhcp' ? '#btn-flush-dhcp' : '#btn-reboot';
-        const statusId = action === 'flush-dhcp' ? '#flush-status'   : '#reboot-status';
-
-        $(btnId).prop('disabled', true);
-        $(statusId).text('Processing...').attr('class', 'action-status');
-
-        $.ajax({
-            url:  '/api/action/' + action,
-            type: 'POST',
-            success: function(data) {
-                $(btnId).prop('disabled', false);
-                $(statusId).text(data.message).attr('class', 'action-status ok');
-                // auto-clear after 6 s
-                setTimeout(function(){ $(statusId).text(''); }, 6000);
-            },
-            error: function(xhr) {
-                $(btnId).prop('disabled', false);
-                const msg = xhr.responseJSON ? xhr.responseJSON.error : 'Request failed';
-                $(statusId).text(msg).attr('class', 'action-status err');
-                setTimeout(function(){ $(statusId).text(''); }, 6000);
-            }
-        });
+        const btn    = $id(action === 'flush-dhcp' ? 'btn-flush-dhcp' : 'btn-reboot');
+        const status = $id(action === 'flush-dhcp' ? 'flush-status'   : 'reboot-status');
+        function showStatus(text, cls) {
+            btn.disabled = false;
+            status.textContent = text;
+            status.className = 'action-status ' + cls;
+            // auto-clear after 6 s
+            setTimeout(function(){ status.textContent = ''; }, 6000);
+        }
+
+        btn.disabled = true;
+        status.textContent = 'Processing...';
+        status.className = 'action-status';
+
+        fetch('/api/action/' + action, { method: 'POST' })
+            .then(function(r) { return r.json().then(function(data) { return { ok: r.ok, data: data }; }); })
+            .then(function(res) {
+                if (res.ok) showStatus(res.data.message, 'ok');
+                else        showStatus(res.data.error || 'Request failed', 'err');
+            })
+            .catch(function() { showStatus('Request failed', 'err'); });
     }
 
     // Close modal if user clicks outside
-    $('#modal-overlay').on('click', function(e) {
-        if ($(e.target).is('#modal-overlay')) closeModal();
+    $id('modal-overlay').addEventListener('click', function(e) {
+        if (e.target.id === 'modal-overlay') closeModal();
     });
 
     // ---- Render helpers ----
-    function updateDebugConsole(logs) {
-        let html = '';
-        logs.slice().reverse().forEach(function(log) {
-            html += '<div class="debug-entry">' +
-                '<span class="debug-time">'+log.time+'</span>' +
-                '<span class="debug-level '+log.level+'">'+log.level+'</span>' +
-                '<span class="debug-message">'+log.message+'</span>' +
-                '</div>';
+    // Keyed row diff: each row is remembered with the markup it was built
+    // from, so unchanged rows keep their DOM nodes, changed ones are swapped,
+    // new ones inserted in order and rows that disappeared are removed.
+    function syncRows(container, items, keyOf, rowHtml, emptyHtml) {
+        if (!items.length) { container._rows = null; container.innerHTML = emptyHtml; return; }
+        let rows = container._rows;
+        if (!rows) { rows = new Map(); container.innerHTML = ''; }
+        const next = new Map();
+        let prev = null;
+        items.forEach(function(item) {
+            let key = keyOf(item);
+            while (next.has(key)) key += '+';   // keep duplicate keys distinct
+            const html = rowHtml(item);
+            let row = rows.get(key);
+            if (!row || row.html !== html) {
+                const tpl = document.createElement('template');
+                tpl.innerHTML = html;
+                const el = tpl.content.firstElementChild;
+                if (row) row.el.replaceWith(el);
+                row = { el: el, html: html };
+            }
+            const want = prev ? prev.nextSibling : container.firstChild;
+            if (row.el !== want) container.insertBefore(row.el, want);
+            rows.delete(key);
+            next.set(key, row);
+            prev = row.el;
         });
-        $('#debug-console').html(html || '<div class="debug-entry"><span class="debug-message">No logs</span></div>');
-        $('#debug-count').text(logs.length + ' ENTRIES');
+        rows.forEach(function(row) { row.el.remove(); });
+        container._rows = next;
     }
 
-    function updateDevices(devices) {
-        if (!devices || !devices.length) {
-            $('#devices-grid').html('<div class="device-item" style="grid-column:1/-1;"><div class="device-info" style="text-align:center;color:var(--comment);">No devices detected</div></div>');
-            $('#device-count').text('0 DEVICES');
-            return;
-        }
-        devices.sort(function(a,b){ return (a.status==='online'?0:1) - (b.status==='online'?0:1); });
-        const onlineCount = devices.filter(function(d){ return d.status==='online'; }).length;
-
-        let html = '';
-        devices.forEach(function(dev) {
-            let connClass, connText, itemClass = 'device-item';
-            if (dev.status === 'online') {
-                if (dev.connection === 'wifi') {
-                    connClass = dev.band==='5g' ? 'conn-wifi-5g' : 'conn-wifi-2g';
-                    connText  = dev.band==='5g' ? '5G WIFI'      : '2.4G WIFI';
-                } else if (dev.connection === 'lan') {
-                    connClass = 'conn-lan'; connText = 'LAN';
-                } else {
-                    connClass = 'conn-unknown'; connText = 'UNKNOWN';
-                }
+    // Row templates, compiled once at load; syncRows() diffs their output
+    const debugRow = log =>
+        `<div class="debug-entry"><span class="debug-time">${log.time}</span>` +
+        `<span class="debug-level ${log.level}">${log.level}</span>` +
+        `<span class="debug-message">${log.message}</span></div>`;
+
+    function updateDebugConsole(logs) {
+        // Server sends newest first, so new entries land on top of the kept ones
+        syncRows(el.debug, logs,
+            function(log) { return log.time + log.level + log.message; }, debugRow,
+            '<div class="debug-entry"><span class="debug-message">No logs</span></div>');
+        el.debugCount.textContent = logs.length + ' ENTRIES';
+    }
+
+    const deviceItem = (dev, itemClass, connClass, connText) =>
+        `<div class="${itemClass}"><div class="device-info"><div class="device-name">${dev.hostname}</div>` +
+        `<div class="device-ip">${dev.ip}</div></div>` +
+        `<span class="device-connection ${connClass}">${connText}</span></div>`;
+
+    function deviceRow(dev) {
+        let connClass, connText, itemClass = 'device-item';
+        if (dev.status === 'online') {
+            if (dev.connection === 'wifi') {
+                connClass = dev.band==='5g' ? 'conn-wifi-5g' : 'conn-wifi-2g';
+                connText  = dev.band==='5g' ? '5G WIFI'      : '2.4G WIFI';
+            } else if (dev.connection === 'lan') {
+                connClass = 'conn-lan'; connText = 'LAN';
             } else {
-                connClass = 'conn-offline'; connText = 'OFFLINE'; itemClass += ' status-offline';
+                connClass = 'conn-unknown'; connText = 'UNKNOWN';
             }
-            html += '<div class="'+itemClass+'">' +
-                '<div class="device-info"><div class="device-name">'+dev.hostname+'</div><div class="device-ip">'+dev.ip+'</div></div>' +
-                '<span class="device-connection '+connClass+'">'+connText+'</span></div>';
-        });
-        $('#devices-grid').html(html);
-        $('#device-count').text(onlineCount+'/'+devices.length+' ONLINE');
+        } else {
+            connClass = 'conn-offline'; connText = 'OFFLINE'; itemClass += ' status-offline';
+        }
+        return deviceItem(dev, itemClass, connClass, connText);
+    }
+
+    function updateDevices(devices, onlineCount) {
+        devices = devices || [];
+        // Server already orders devices online-first, then by IP
+        syncRows(el.devices, devices,
+            function(dev) { return dev.mac; }, deviceRow,
+            '<div class="device-item" style="grid-column:1/-1;"><div class="device-info" style="text-align:center;color:var(--comment);">No devices detected</div></div>');
+        el.devCount.textContent = devices.length ? onlineCount+'/'+devices.length+' ONLINE' : '0 DEVICES';
     }
 
+    const procRow = p =>
+        `<tr><td class="proc-pid">${p.pid}</td><td class="proc-name">${p.name}</td>` +
+        `<td class="proc-state state-${p.state || 'S'}">${p.state}</td>` +
+        `<td class="proc-mem">${p.rss_mb} MB</td>` +
+        `<td style="color:var(--comment);font-size:0.65rem;font-family:Fira Code,monospace;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;" title="${p.cmd}">${p.cmd}</td></tr>`;
+
     function updateProcesses(procs) {
-        if (!procs || !procs.length) {
-            $('#proc-body').html('<tr><td colspan="5" style="text-align:center;color:var(--comment);">No process data</td></tr>');
-            $('#proc-count').text('0 PROCESSES');
-            return;
-        }
-        let html = '';
-        procs.forEach(function(p) {
-            const stateClass = 'state-' + (p.state || 'S');
-            html += '<tr>' +
-                '<td class="proc-pid">'+p.pid+'</td>' +
-                '<td class="proc-name">'+p.name+'</td>' +
-                '<td class="proc-state '+stateClass+'">'+p.state+'</td>' +
-                '<td class="proc-mem">'+p.rss_mb+' MB</td>' +
-                '<td style="color:var(--comment);font-size:0.65rem;font-family:Fira Code,monospace;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;" title="'+p.cmd+'">'+p.cmd+'</td>' +
-                '</tr>';
-        });
-        $('#proc-body').html(html);
-        $('#proc-count').text(procs.length + ' PROCESSES');
+        procs = procs || [];
+        syncRows(el.procBody, procs,
+            function(p) { return p.pid; }, procRow,
+            '<tr><td colspan="5" style="text-align:center;color:var(--comment);">No process data</td></tr>');
+        el.procCount.textContent = procs.length + ' PROCESSES';
     }
 
-    // ---- Main polling loop ----
-    function refresh() {
+    const flowRow = f =>
+        `<tr><td class="source-ip">${f.src}</td><td style="text-align:center;color:var(--comment);">↔</td>` +
+        `<td class="dest-ip">${f.dst}</td>` +
+        `<td><span class="traffic-badge ${f.badge_class}">${f.label}</span></td>` +
+        `<td class="bw-val">${f.last_2s}</td></tr>`;
+
+    // ---- Render one stats snapshot ----
+    function renderStats(data) {
         updateCounter++;
+        consecutiveErrors = 0;
+        el.indicator.classList.remove('offline');
+
+        if (data.status !== 'Online') { el.indicator.classList.add('offline'); return; }
+
+        // Latency
+        let ping = parseInt(data.ping);
+        el.pingVal.textContent = ping;
+        el.pingVal.className = 'value '+(ping<30?'color-green':ping<70?'color-yellow':'color-red');
+
+        // CPU load
+        let load = parseFloat(data.load);
+        el.loadVal.textContent = load.toFixed(1)+'%';
+        el.loadFill.style.width = getLoadWidth(load)+'%';
+        el.loadFill.style.backgroundColor = getLoadColor(load);
+
+        // Temperature
+        if (data.temp !== '--') {
+            let temp = parseFloat(data.temp);
+            el.tempVal.textContent = temp.toFixed(1)+'°';
+            el.tempFill.style.width = getTempWidth(temp)+'%';
+            el.tempFill.style.backgroundColor = getTempColor(temp);
+            el.tempStatus.textContent =
+                temp>80 ? '⚠ HIGH – Monitor router cooling' :
+                temp>70 ? '⚡ Warm but acceptable' :
+                          '✓ Normal operating temp';
+            el.tempStatus.style.color = getTempColor(temp);
+        } else {
+            el.tempVal.textContent = '--';
+            el.tempFill.style.width = '0%';
+            el.tempStatus.textContent = '✗ Sensor unavailable';
+            el.tempStatus.style.color = 'var(--red)';
+        }
 
-        $.getJSON('/api/stats').done(function(data) {
-            consecutiveErrors = 0;
-            $('#connection-indicator').removeClass('offline');
-
-            if (data.status !== 'Online') { $('#connection-indicator').addClass('offline'); return; }
-
-            // Latency
-            let ping = parseInt(data.ping);
-            $('#ping-val').text(ping).attr('class','value '+(ping<30?'color-green':ping<70?'color-yellow':'color-red'));
-
-            // CPU load
-            let load = parseFloat(data.load);
-            $('#load-val').text(load.toFixed(1)+'%');
-            $('#load-fill').css({ width: getLoadWidth(load)+'%', 'background-color': getLoadColor(load) });
-
-            // Temperature
-            if (data.temp !== '--') {
-                let temp = parseFloat(data.temp);
-                $('#temp-val').text(temp.toFixed(1)+'°');
-                $('#temp-fill').css({ width: getTempWidth(temp)+'%', 'background-color': getTempColor(temp) });
-                $('#temp-status').html(
-                    temp>80 ? '⚠ HIGH – Monitor router cooling' :
-                    temp>70 ? '⚡ Warm but acceptable' :
-                              '✓ Normal operating temp'
-                ).css('color', getTempColor(temp));
-            } else {
-                $('#temp-val').text('--');
-                $('#temp-fill').css('width','0%');
-                $('#temp-status').html('✗ Sensor unavailable').css('color','var(--red)');
-            }
+        // Memory
+        el.memVal.textContent = data.memory+'%';
 
-            // Memory
-            $('#mem-val').text(data.memory+'%');
-
-            // Throughput
-            $('#download-speed').html(formatSpeed(data.download_mbps)+' <span class="unit" style="display:inline;margin:0;font-size:1.2rem;">Mbps</span>');
-            $('#upload-speed').html(formatSpeed(data.upload_mbps)+' <span class="unit" style="display:inline;margin:0;font-size:1.2rem;">Mbps</span>');
-            $('#total-speed').html(formatSpeed(data.total_mbps)+' <span class="unit" style="display:inline;margin:0;font-size:1.2rem;">Mbps</span>');
-
-            // Uptime / clock
-            if (data.router_uptime) $('#router-uptime').text(data.router_uptime);
-            $('#clock').text(data.time);
-
-            // ---- Active connections with traffic badges ----
-            let rows = '';
-            data.iftop.slice(0,10).forEach(function(f) {
-                rows += '<tr>' +
-                    '<td class="source-ip">'+f.src+'</td>' +
-                    '<td style="text-align:center;color:var(--comment);">↔</td>' +
-                    '<td class="dest-ip">'+f.dst+'</td>' +
-                    '<td><span class="traffic-badge '+f.badge_class+'">'+f.label+'</span></td>' +
-                    '<td class="bw-val">'+f.last_2s+'</td>' +
-                    '</tr>';
-            });
-            $('#iftop-body').html(rows || '<tr><td colspan="5" style="text-align:center;color:var(--comment);">NO ACTIVE CONNECTIONS</td></tr>');
-            $('#conn-count').text(data.iftop.length+' TOTAL (TOP 10)');
+        // Throughput
+        const unit = ' <span class="unit" style="display:inline;margin:0;font-size:1.2rem;">Mbps</span>';
+        el.download.innerHTML = formatSpeed(data.download_mbps) + unit;
+        el.upload.innerHTML   = formatSpeed(data.upload_mbps) + unit;
+        el.total.innerHTML    = formatSpeed(data.total_mbps) + unit;
 
-            // ---- Processes ----
-            if (data.processes) updateProcesses(data.processes);
+        // Uptime / clock
+        if (data.router_uptime) el.uptime.textContent = data.router_uptime;
+        el.clock.textContent = data.time;
 
-            // ---- Debug ----
-            if (data.debug_logs) updateDebugConsole(data.debug_logs);
+        // ---- Active connections with traffic badges ----
+        syncRows(el.iftopBody, data.iftop.slice(0,10),
+            function(f) { return f.src + '>' + f.dst; }, flowRow,
+            '<tr><td colspan="5" style="text-align:center;color:var(--comment);">NO ACTIVE CONNECTIONS</td></tr>');
+        el.connCount.textContent = data.iftop.length+' TOTAL (TOP 10)';
 
-            // ---- Devices ----
-            if (data.devices) updateDevices(data.devices);
+        // ---- Processes ----
+        if (data.processes) updateProcesses(data.processes);
 
-        }).fail(function() {
-            consecutiveErrors++;
-            $('#connection-indicator').addClass('offline');
-        });
+        // ---- Debug ----
+        if (data.debug_logs) updateDebugConsole(data.debug_logs);
+
+        // ---- Devices ----
+        if (data.devices) updateDevices(data.devices, data.devices_online);
     }
 
-    setInterval(refresh, 2500);
-    refresh();
+    // All DOM writes for a snapshot happen in one animation frame, and
+    // snapshots arriving faster than the display refreshes collapse into one.
+    let pendingStats = null;
+    function scheduleRender(data) {
+        if (pendingStats === null) {
+            requestAnimationFrame(function() {
+                const next = pendingStats;
+                pendingStats = null;
+                renderStats(next);
+            });
+        }
+        pendingStats = data;
+    }
+
+    // ---- One-shot fetch (fallback when EventSource is unavailable or refused) ----
+    // Each poll schedules the next one only after it settles, so slow
+    // responses can't stack up requests.  The last ETag is sent back; a 304
+    // means nothing changed and the page is left as it is.  While requests
+    // keep failing the delay doubles (2.5 s, 5 s, 10 s ... capped at 60 s)
+    // and drops back on the first success.
+    const POLL_MS = 2500, POLL_MAX_MS = 60000;
+    const backoff = n => Math.min(POLL_MAX_MS, POLL_MS * Math.pow(2, Math.min(n, 5)));
+    let polling   = !window.EventSource;   // also set while a refused stream waits to retry
+    let pollDelay = POLL_MS;
+    let pollTimer = null;
+    let inFlight  = false;
+    let statsEtag = null;
+    function refresh() {
+        if (inFlight) return Promise.resolve();
+        inFlight = true;
+        return fetch('/api/stats', { cache: 'no-store', headers: statsEtag ? { 'If-None-Match': statsEtag } : {} })
+            .then(function(r) {
+                if (!r.ok && r.status !== 304) throw new Error(r.status);
+                consecutiveErrors = 0;
+                pollDelay = POLL_MS;
+                if (r.status === 304) return;
+                statsEtag = r.headers.get('ETag');
+                return r.json().then(scheduleRender);
+            })
+            .catch(function() {
+                consecutiveErrors++;
+                pollDelay = backoff(consecutiveErrors);
+                el.indicator.classList.add('offline');
+            })
+            .finally(function() { inFlight = false; });
+    }
+
+    // A hidden tab lets its timer lapse without polling or rescheduling;
+    // becoming visible starts the loop again.  The loop also ends once a
+    // stream is back up and clears `polling`.
+    function schedulePoll() {
+        clearTimeout(pollTimer);
+        if (!polling) { pollTimer = null; return; }
+        pollTimer = setTimeout(function() {
+            pollTimer = null;
+            if (!document.hidden) refresh().then(schedulePoll);
+        }, pollDelay);
+    }
+
+    // ---- Live updates ----
+    // The server pushes each new snapshot over Server-Sent Events, so the
+    // browser no longer polls; EventSource reconnects on its own after errors.
+    // Frames are either a full snapshot or {"patch": {...changed keys}} to
+    // merge into the last one.
+    // While the tab is hidden the stream is closed (or the fallback poll
+    // skipped); becoming visible again reopens it and the first frame is a
+    // full snapshot, so nothing is lost.
+    // A refused stream (e.g. the server's 503 while its stream slots are
+    // taken) is closed for good by the browser, so the page polls
+    // /api/stats meanwhile and retries the stream on the backoff schedule or
+    // when the tab is shown again; its first message ends the polling.
+    let current = {};
+    let stream  = null;
+    let streamFailures = 0;
+    let streamRetry    = null;
+    function openStream() {
+        clearTimeout(streamRetry);
+        streamRetry = null;
+        const es = stream = new EventSource('/api/stream');
+        es.onmessage = function(e) {
+            streamFailures = 0;
+            if (polling) { polling = false; clearTimeout(pollTimer); pollTimer = null; }
+            const msg = JSON.parse(e.data);
+            current = msg.patch ? Object.assign(current, msg.patch) : msg;
+            scheduleRender(current);
+        };
+        es.onerror   = function() {
+            consecutiveErrors++;
+            el.indicator.classList.add('offline');
+            if (es.readyState === EventSource.CLOSED) {
+                if (stream === es) stream = null;
+                polling = true;
+                startPolling();
+                streamRetry = setTimeout(function() {
+                    streamRetry = null;
+                    if (!document.hidden && !stream) openStream();
+                }, backoff(++streamFailures));
+            }
+        };
+    }
+    function startPolling() {
+        if (!pollTimer && !inFlight) refresh().then(schedulePoll);
+    }
+    document.addEventListener('visibilitychange', function() {
+        if (document.hidden) {
+            if (stream) { stream.close(); stream = null; }
+            clearTimeout(streamRetry);
+            streamRetry = null;
+        } else {
+            if (polling) startPolling();
+            if (window.EventSource && !stream) openStream();
+        }
+    });
+    if (!document.hidden) {
+        if (polling) startPolling(); else openStream();
+    }
 </script>
 </body>
 </html>
 """
 
+# INTERFACE is the only template input and never changes while running, so
+# the page is rendered once at import and every GET / serves the same bytes.
+# Indentation and blank lines are dropped; the page has no <pre> or other
+# whitespace-sensitive markup, and line breaks are kept so JS is unaffected.
+_INDEX_HTML = re.sub(rb'\n\s+', b'\n',
+                     app.jinja_env.from_string(HTML_TEMPLATE).render(INTERFACE=INTERFACE).encode())
+_INDEX_ETAG = hashlib.blake2b(_INDEX_HTML, digest_size=8).hexdigest()
+_INDEX_GZIP = gzip.compress(_INDEX_HTML, 9)
+
 
 # ---------------------------------------------------------------------------
 # BACKEND — data fetchers
 # ---------------------------------------------------------------------------
+# ROUTER_IP / INTERFACE / LAN_INTERFACE are fixed for the life of the process,
+# so the ssh argv and the polling scripts are built once here rather than
+# re-assembled on every refresh.  Scripts are passed to ssh as a single argv
+# entry (no local shell), so they need no quote / $ escaping.
+_SSH_ARGS = [
+    "ssh",
+    "-o", "ControlMaster=auto", "-o", f"ControlPath={SSH_CONTROL_PATH}", "-o", "ControlPersist=600",
+    "-o", "ServerAliveInterval=30", "-o", "ConnectTimeout=3", "-o", "BatchMode=yes",
+    f"root@{ROUTER_IP}",
+]
+
+# Candidate CPU sensor files, in preference order.  Which one exists is fixed
+# for a given router, so the probe loop only runs until a poll has found it.
+_TEMP_PATHS = (
+    "/sys/class/thermal/thermal_zone0/temp",
+    "/sys/devices/virtual/thermal/thermal_zone0/temp",
+    "/sys/class/hwmon/hwmon0/temp1_input",
+)
+# Prints "<reading> <path>" for the first readable file, else "0"
+_TEMP_PROBE = (f'for f in {" ".join(_TEMP_PATHS)}; do\n'
+               '  [ -r "$f" ] && echo "$(cat "$f") $f" && break\n'
+               'done || echo 0')
+
+# Everything polled on every refresh, in a single SSH round-trip: load, ping,
+# WAN bytes, temp and memory (one line each), then whichever cached sections
+# are due (the 2 s iftop sample among them) — each after its own sentinel line.
+# @TEMP@ is the sensor read — the probe above until the path is known.
+_ROUTER_SCRIPT = f"""
+cut -d' ' -f1 /proc/loadavg
+ping -c 1 8.8.8.8 | awk -F'time=' '/time=/ {{t=$2+0}} END {{print t+0}}'
+awk -v i={INTERFACE} -F'[: ]+' '{{sub(/^ +/, "")}} $1 == i {{print $2, $10; f=1}} END {{if (!f) print 0, 0}}' /proc/net/dev
+@TEMP@
+awk '/MemTotal/ {{t=$2}} /MemAvailable/ {{a=$2}} END {{printf "%d\\n", ((t-a)/t)*100}}' /proc/meminfo
+"""
+_router_script = _ROUTER_SCRIPT.replace("@TEMP@", _TEMP_PROBE)
+
+# The 2 s iftop sample dominates a poll, so on the polls where it is due it
+# starts in the background before everything else and is collected at the
+# end: that round-trip costs max(iftop, rest) on the router instead of the sum.
+# All sections run in one shell, so each must use variable names no other uses.
+_IFTOP_START = f"""nm_iftop_out=/tmp/nm-iftop.$$
+iftop -i {LAN_INTERFACE} -t -s 2 -n -N -P -L 20 >"$nm_iftop_out" 2>/dev/null &
+"""
+_IFTOP_COLLECT = """wait
+echo '---IFTOP---'
+cat "$nm_iftop_out"; rm -f "$nm_iftop_out"
+"""
+
+# Sentinel lines of the top-level sections; split() yields name/body pairs
+_SECTION_RE = re.compile(rb'^---(UPTIME|PROCESSES|DEVICES|IFTOP)---\n', re.M)
+
+# iftop -t prints every flow as a pair of lines:
+#    1 10.0.0.12:51514          =>     1.20Mb     1.20Mb     1.20Mb      307KB
+#      142.250.72.14:443        <=     15.3Mb     15.3Mb     15.3Mb     3.83MB
+# One match per flow: local host from the "=>" line, remote host, port and
+# "last 2s" rate from the "<=" line under it.  With -P hosts are "ip:port",
+# but some builds print "ip port"; the lazy host group leaves the port out.
+_IFTOP_FLOW_RE = re.compile(
+    rb'^ *\d+ +(\S+?)(?:[: ]\d+)? +=>[^\n]*\n'
+    rb' *(\S+?)(?:[: ](\d+))? +<= +(\S+)',
+    re.M)
+
+# ARP table, per-radio station lists and DHCP leases, split by sentinels
+_DEVICES_SECTION = """echo '---DEVICES---'
+awk 'NR>1 {print $1,$4,$6}' /proc/net/arp
+echo '---WIFI_SCAN---'
+iw dev | awk '/Interface/ {print $2}' | while read iface; do
+  freq=$(iw dev $iface info | awk 'match($0, /[0-9]+ MHz/) {print substr($0, RSTART, RLENGTH-4); exit}')
+  echo "IFACE $iface $freq"
+  iw dev $iface station dump | awk '/^Station/ {print $2}'
+done
+echo '---DHCP---'
+cat /tmp/dhcp.leases 2>/dev/null || echo ''
+"""
+
+_UPTIME_SECTION = """echo '---UPTIME---'
+cut -d' ' -f1 /proc/uptime
+"""
 
-def get_router_uptime():
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
+# BusyBox ps on OpenWrt 21.02 does NOT support 'auxo' or keyword field lists,
+# so it gets 'ps -eo' with the short column names it understands.  One awk
+# pass keeps the header plus the 15 largest by rss (highest memory consumers
+# first) in an insertion-sorted array, instead of piping every process
+# through sort and head.
+_PROCESSES_SECTION = """echo '---PROCESSES---'
+ps -eo pid,vsz,rss,stat,comm,args 2>/dev/null | awk '
+NR == 1 {print; next}
+{
+  r = $3 + 0
+  for (i = n; i > 0 && R[i] < r; i--) if (i < 15) {R[i+1] = R[i]; L[i+1] = L[i]}
+  if (i < 15) {R[i+1] = r; L[i+1] = $0; if (n < 15) n++}
+}
+END {for (i = 1; i <= n; i++) print L[i]}'
+"""
+
+
+# Asks the running master to shut down; the next run_ssh then dials afresh
+_SSH_EXIT_ARGS = ["ssh", "-o", f"ControlPath={SSH_CONTROL_PATH}", "-O", "exit", f"root@{ROUTER_IP}"]
+
+
+def reset_ssh_master():
+    """Drop the shared ControlMaster connection (best effort)."""
+    try:
+        subprocess.run(_SSH_EXIT_ARGS, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=3)
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+
+def prime_ssh_master():
+    """Open the ControlMaster up front so the first poll only opens a channel."""
+    try:
+        run_ssh("true")
+        log_debug("SUCCESS", f"SSH master connected to {ROUTER_IP}")
+    except Exception as e:
+        log_debug("WARNING", f"SSH master not ready: {str(e)[:60]}")
+
+
+def run_ssh(script, timeout=5):
+    """Run a shell script on the router and return its raw stdout (bytes)."""
+    try:
+        return subprocess.check_output(_SSH_ARGS + [script], timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # A master whose TCP link silently died keeps accepting sessions that
+        # never answer — tear it down so the next poll reconnects.
+        reset_ssh_master()
+        raise
+    except subprocess.CalledProcessError as e:
+        if e.returncode == 255:     # ssh itself failed, not the remote script
+            reset_ssh_master()
+        raise
+
+
+def format_uptime(result):
+    """Render /proc/uptime seconds as e.g. '3d 4h 12m'."""
     try:
-        result = subprocess.check_output(
-            f"{ssh_base} \"cat /proc/uptime | cut -d' ' -f1\"",
-            shell=True, timeout=5
-        ).decode().strip()
         s = int(float(result))
         d, h, m = s // 86400, (s % 86400) // 3600, (s % 3600) // 60
         if d > 0: return f"{d}d {h}h {m}m"
@@ -1035,98 +1439,109 @@ def get_router_uptime():
         return "--"
 
 
-def get_connected_devices():
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
+# Lower-cases hex digits in a bytes MAC without decoding it
+_MAC_LOWER = bytes.maketrans(b'ABCDEF', b'abcdef')
+
+# Wifi-section line shapes: "IFACE <name> <MHz>" headers and bare station MACs
+_IFACE_RE = re.compile(rb'IFACE \S+ (\d+)')
+_MAC_RE   = re.compile(rb'[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}$')
+
+
+def _ip_key(ip):
+    """
+    Dotted-quad IPv4 → its 4 packed bytes.  Bytes compare in the same order as
+    the addresses do numerically, so this is a sort key with no int() work.
+    """
     try:
-        log_debug("INFO", "Scanning network devices...")
-        cmd = (
-            f"{ssh_base} \""
-            f"cat /proc/net/arp | grep -v 'IP address' | awk '{{print \\$1,\\$4,\\$6}}'; "
-            f"echo '---WIFI_SCAN---'; "
-            f"iw dev | grep Interface | awk '{{print \\$2}}' | while read iface; do "
-            f"  freq=\\$(iw dev \\$iface info | grep -oE '[0-9]+ MHz' | head -n1 | awk '{{print \\$1}}'); "
-            f"  echo \\\"IFACE \\$iface \\$freq\\\"; "
-            f"  iw dev \\$iface station dump | grep Station | awk '{{print \\$2}}'; "
-            f"done; "
-            f"echo '---DHCP---'; "
-            f"cat /tmp/dhcp.leases 2>/dev/null || echo ''"
-            f"\""
-        )
-        result = subprocess.check_output(cmd, shell=True, timeout=10).decode().strip()
+        return socket.inet_aton(ip)
+    except OSError:
+        return b'\x00\x00\x00\x00'
+
 
+class Device:
+    """One LAN client during the scan merge — serialised with to_dict() for the JSON."""
+    __slots__ = ("mac", "ip", "hostname", "status", "connection", "band")
+
+    def __init__(self, mac, ip, hostname, status='offline', connection='lan', band=''):
+        self.mac, self.ip, self.hostname = mac, ip, hostname
+        self.status, self.connection, self.band = status, connection, band
+
+    def to_dict(self):
+        return {'mac': self.mac, 'ip': self.ip, 'hostname': self.hostname,
+                'status': self.status, 'connection': self.connection, 'band': self.band}
+
+
+def parse_devices(raw):
+    """
+    Build (device_list, online_count) from the device-scan section (bytes) of
+    the poll script.  Only the fields that reach the JSON get decoded.  None
+    on failure, so the previous list stays cached and the next poll rescans.
+    """
+    try:
         known_devices, active_arp, wifi_mac_bands = {}, {}, {}
         section, current_band = 'arp', None
 
-        for line in result.split('\n'):
+        for line in raw.split(b'\n'):
             line = line.strip()
             if not line: continue
-            if '---WIFI_SCAN---' in line: section = 'wifi'; continue
-            if '---DHCP---'     in line: section = 'dhcp'; continue
+            if line == b'---WIFI_SCAN---': section = 'wifi'; continue
+            if line == b'---DHCP---':      section = 'dhcp'; continue
 
             if section == 'arp':
                 parts = line.split()
                 if len(parts) >= 3:
-                    ip, mac = parts[0], parts[1]
-                    if mac != '00:00:00:00:00:00':
+                    ip, mac = parts[0], parts[1].translate(_MAC_LOWER)
+                    if mac != b'00:00:00:00:00:00':
                         active_arp[ip] = mac
 
             elif section == 'wifi':
-                if line.startswith('IFACE'):
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        current_band = '5g' if int(parts[2]) > 4000 else '2.4g'
-                else:
-                    mac = line.lower()
-                    if len(mac) == 17 and current_band:
-                        wifi_mac_bands[mac] = current_band
+                if line.startswith(b'IFACE'):
+                    m = _IFACE_RE.match(line)
+                    # No frequency (radio down) → don't attribute its stations to the previous band
+                    current_band = ('5g' if int(m.group(1)) > 4000 else '2.4g') if m else None
+                elif current_band and _MAC_RE.match(line):
+                    wifi_mac_bands[line.translate(_MAC_LOWER)] = current_band
 
             elif section == 'dhcp':
                 parts = line.split()
                 if len(parts) >= 4:
-                    mac, ip, hostname = parts[1].lower(), parts[2], parts[3]
-                    if hostname == '*': hostname = f"Unknown ({ip.split('.')[-1]})"
-                    known_devices[mac] = { 'mac': mac, 'ip': ip, 'hostname': hostname,
-                                           'status': 'offline', 'connection': 'lan', 'band': '' }
+                    mac, ip = parts[1].translate(_MAC_LOWER), parts[2].decode()
+                    hostname = parts[3].decode(errors='replace')
+                    if hostname == '*': hostname = f"Unknown ({ip.rpartition('.')[2]})"
+                    known_devices[mac] = Device(mac.decode(), ip, hostname)
 
         for ip, mac in active_arp.items():
-            if mac in known_devices:
-                known_devices[mac]['status'] = 'online'
+            dev = known_devices.get(mac)
+            if dev:
+                dev.status = 'online'
             else:
-                known_devices[mac] = { 'mac': mac, 'ip': ip, 'hostname': ip,
-                                       'status': 'online', 'connection': 'lan', 'band': '' }
+                ip = ip.decode()
+                known_devices[mac] = Device(mac.decode(), ip, ip, status='online')
 
         for mac, band in wifi_mac_bands.items():
-            if mac in known_devices:
-                known_devices[mac]['status'] = 'online'
-                known_devices[mac]['connection'] = 'wifi'
-                known_devices[mac]['band'] = band
-
-        device_list = sorted(known_devices.values(),
-                             key=lambda x: (0 if x['status']=='online' else 1,
-                                            [int(p) for p in x['ip'].split('.') if p.isdigit()]))
-        online = sum(1 for d in device_list if d['status']=='online')
+            dev = known_devices.get(mac)
+            if dev:
+                dev.status, dev.connection, dev.band = 'online', 'wifi', band
+
+        devices = sorted(known_devices.values(),
+                         key=lambda d: (0 if d.status == 'online' else 1, _ip_key(d.ip)))
+        online = sum(1 for d in devices if d.status == 'online')
+        device_list = [d.to_dict() for d in devices]
         log_debug("SUCCESS", f"Found {len(device_list)} devices ({online} online)")
-        return device_list
+        return device_list, online
 
     except Exception as e:
         log_debug("ERROR", f"Device scan failed: {str(e)[:60]}")
-        return []
+        return None
 
 
-def get_processes():
+def parse_processes(output):
     """
-    Pull top-15 processes sorted by RSS (memory) via BusyBox ps on OpenWrt.
-    BusyBox ps on OpenWrt 21.02 does NOT support 'auxo' or keyword field lists.
-    We use 'ps -eo' with the short column names it actually understands.
+    Top-15 processes sorted by RSS (memory) from the BusyBox ps section of the
+    poll script.  Columns: pid, vsz, rss, stat, comm, args.
     """
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
     try:
-        # BusyBox ps -eo columns: pid, vsz, rss, stat, comm, args
-        # We sort by rss descending (highest memory consumers first) and take 16 lines (header + 15)
-        cmd = (f'{ssh_base} "'
-               f'ps -eo pid,vsz,rss,stat,comm,args 2>/dev/null | sort -t\\  -k3 -rn | head -16'
-               f'"')
-        raw = subprocess.check_output(cmd, shell=True, timeout=5).decode().strip().split('\n')
+        raw = output.strip().split('\n')
 
         # Log first two lines so we can see the actual header/format if something goes wrong
         if len(raw) > 0:
@@ -1169,30 +1584,81 @@ def get_processes():
         return []
 
 
+def parse_iftop(raw):
+    """Parse the iftop -t dump (bytes) into the connection list for the flows table"""
+    iftop_list = []
+    try:
+        line_count = raw.count(b'\n')
+        log_debug("SUCCESS", f"iftop returned {line_count} lines")
+
+        for m in _IFTOP_FLOW_RE.finditer(raw):
+            src, dst_ip, dst_port, last_2s = m.groups()
+            dst_ip = dst_ip.decode()
+            # No port on the remote host: default guess HTTPS
+            label, badge_class = classify_connection(dst_ip, int(dst_port) if dst_port else 443)
+            iftop_list.append({
+                "src":        src.decode(),
+                "dst":        dst_ip,
+                "last_2s":    last_2s.decode(),
+                "label":      label,
+                "badge_class": badge_class
+            })
+
+        if iftop_list:
+            log_debug("SUCCESS", f"Parsed {len(iftop_list)} connections")
+        else:
+            log_debug("WARNING", "iftop returned no connection pairs")
+
+    except Exception as e:
+        log_debug("ERROR", f"iftop parse: {str(e)[:60]}")
+    return iftop_list
+
+
+# Poll sections that change slowly: name -> (script, TTL, parser).  Each is only
+# appended to the poll script once its cached value is older than the TTL.
+# iftop stays last: its collect step waits for the sample started up front.
+_CACHED_SECTIONS = {
+    "uptime":    (_UPTIME_SECTION,    UPTIME_CACHE_TTL,  lambda raw: format_uptime(raw.decode())),
+    "processes": (_PROCESSES_SECTION, PROCESS_CACHE_TTL, lambda raw: parse_processes(raw.decode(errors='replace'))),
+    "devices":   (_DEVICES_SECTION,   DEVICE_CACHE_TTL,  parse_devices),
+    "iftop":     (_IFTOP_COLLECT,     IFTOP_CACHE_TTL,   parse_iftop),
+}
+
+
+def sections_due():
+    """Names of the cached sections whose value has expired (or was never fetched)."""
+    # Monotonic, so a wall-clock step back can't hold every section past its
+    # TTL.  Its origin is arbitrary (boot on Linux), hence the explicit check
+    # for a section that has never been fetched.
+    now = time.monotonic()
+    return [name for name, (_, ttl, _) in _CACHED_SECTIONS.items()
+            if name not in _section_cache or now - _section_cache[name][0] >= ttl]
+
+
+def cached_section(name, default):
+    return _section_cache.get(name, (0.0, default))[1]
+
+
 def get_router_data():
     """Fetch all router metrics via SSH"""
-    global last_state
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
-
-    # --- Core metrics (single SSH round-trip) ---
-    cmd = (
-        f"{ssh_base} \""
-        f"cat /proc/loadavg | cut -d' ' -f1; "
-        f"ping -c 1 8.8.8.8 | grep 'time=' | cut -d'=' -f4 | sed 's/ ms//' || echo 0; "
-        f"grep {INTERFACE} /proc/net/dev | awk '{{print \\$2,\\$10}}'; "
-        f"cat /sys/class/thermal/thermal_zone0/temp 2>/dev/null || "
-        f"cat /sys/devices/virtual/thermal/thermal_zone0/temp 2>/dev/null || "
-        f"cat /sys/class/hwmon/hwmon0/temp1_input 2>/dev/null || "
-        f"echo 0; "
-        f"awk '/MemTotal/ {{t=\\$2}} /MemAvailable/ {{a=\\$2}} END {{printf \\\"%d\\\", ((t-a)/t)*100}}' /proc/meminfo"
-        f"\""
-    )
+    global _router_script
 
     try:
+        due = sections_due()
+        if "devices" in due:
+            log_debug("INFO", "Scanning network devices...")
         log_debug("INFO", f"SSH query to {ROUTER_IP}...")
-        raw = subprocess.check_output(cmd, shell=True, timeout=10).decode().strip().split('\n')
+        script = ((_IFTOP_START if "iftop" in due else "") + _router_script
+                  + "".join(_CACHED_SECTIONS[name][0] for name in due))
+        output = run_ssh(script, timeout=10)
         log_debug("SUCCESS", "Router responded successfully")
 
+        # Split as bytes; only the short sections are decoded, while the
+        # iftop dump (the bulk of the output) is matched as bytes by parse_iftop.
+        parts = _SECTION_RE.split(output)
+        sections = dict(zip(parts[1::2], parts[2::2]))
+        raw = parts[0].decode().strip().split('\n')
+
         # load_raw is the 1-min load average.  On a 4-core system it can reach 4.0.
         # Divide by core count so the bar and percentage are always 0–100.
         load_percentage = round((float(raw[0]) / CPU_CORES) * 100, 1)
@@ -1203,7 +1669,12 @@ def get_router_data():
         current_rx = int(net_stats[0]) if len(net_stats) > 0 and net_stats[0].isdigit() else 0
         current_tx = int(net_stats[1]) if len(net_stats) > 1 and net_stats[1].isdigit() else 0
 
-        temp_raw = raw[3]
+        temp_parts = raw[3].split()
+        temp_raw = temp_parts[0] if temp_parts else ''
+        if len(temp_parts) > 1 and temp_raw.isdigit():
+            # Probe found the sensor — read just that file on later polls
+            _router_script = _ROUTER_SCRIPT.replace("@TEMP@", f"cat {temp_parts[1]} 2>/dev/null || echo 0")
+            log_debug("INFO", f"Temp sensor: {temp_parts[1]}")
         if temp_raw.isdigit():
             t = int(temp_raw)
             temp = round(float(t) if t < 200 else t / 1000, 1)
@@ -1212,96 +1683,36 @@ def get_router_data():
 
         memory = raw[4] if raw[4].isdigit() else "0"
 
-        # Speed calc
-        now = time.time()
-        time_diff = now - last_state['time']
+        # Speed calc — monotonic clock, immune to NTP steps on this host
+        now = time.monotonic()
+        if wan_samples and (current_rx < wan_samples[-1][1] or current_tx < wan_samples[-1][2]):
+            wan_samples.clear()     # counters went backwards: router rebooted
+        wan_samples.append((now, current_rx, current_tx))
+        first_time, first_rx, first_tx = wan_samples[0]
+        time_diff = now - first_time
         if time_diff > 0:
-            rx_diff = max(0, current_rx - last_state['rx_bytes'])
-            tx_diff = max(0, current_tx - last_state['tx_bytes'])
-            download_mbps = round(((rx_diff * 8) / 1024 / 1024) / time_diff, 2)
-            upload_mbps   = round(((tx_diff * 8) / 1024 / 1024) / time_diff, 2)
+            # Bytes → megabits (10^6 bits, as the UI's "Mbps" reads): 1 Mb = 125000 B
+            bytes_per_mb = 125000.0 * time_diff
+            download_mbps = round((current_rx - first_rx) / bytes_per_mb, 2)
+            upload_mbps   = round((current_tx - first_tx) / bytes_per_mb, 2)
             total_mbps    = round(download_mbps + upload_mbps, 2)
             if total_mbps > 0.1:
                 log_debug("INFO", f"Traffic: ↓{download_mbps}Mbps ↑{upload_mbps}Mbps")
         else:
             download_mbps = upload_mbps = total_mbps = 0.0
 
-        last_state = { "rx_bytes": current_rx, "tx_bytes": current_tx, "time": now }
-
-        # --- iftop (separate SSH call, isolated output) ---
-        log_debug("INFO", f"Polling iftop on {LAN_INTERFACE}...")
-        iftop_cmd = (
-            f"{ssh_base} \""
-            f"iftop -i {LAN_INTERFACE} -t -s 2 -n -N -P -L 20 2>/dev/null"
-            f"\""
-        )
-        iftop_list = []
-        try:
-            iftop_raw   = subprocess.check_output(iftop_cmd, shell=True, timeout=8).decode()
-            iftop_lines = iftop_raw.strip().split('\n')
-            log_debug("SUCCESS", f"iftop returned {len(iftop_lines)} lines")
-
-            i = 0
-            while i < len(iftop_lines) - 1:
-                out_line = iftop_lines[i]
-                in_line  = iftop_lines[i + 1]
-
-                if '=>' in out_line and '<=' in in_line:
-                    try:
-                        left, right = out_line.split('=>')
-                        src = left.strip()
-                        right_parts = right.split()
-                        # right_parts[0] = dst_ip  right_parts[1] = dst_port (because -P flag)
-                        # With -P the format is  ip:port  but some builds use space-separated.
-                        # Handle both "ip:port" and "ip port" formats.
-                        dst_token = right_parts[0]
-                        if ':' in dst_token:
-                            dst_ip, dst_port = dst_token.rsplit(':', 1)
-                        elif len(right_parts) > 1 and right_parts[1].isdigit():
-                            dst_ip, dst_port = dst_token, right_parts[1]
-                        else:
-                            dst_ip, dst_port = dst_token, '443'   # default guess HTTPS
-
-                        # Also strip port from src if present
-                        if ':' in src:
-                            src = src.rsplit(':', 1)[0]
-
-                        in_parts = in_line.split()
-                        bw_2s = in_parts[-1] if in_parts else '0'
-
-                        # Classify the connection
-                        label, badge_class = classify_connection(dst_ip, dst_port)
-
-                        if src and dst_ip:
-                            iftop_list.append({
-                                "src":        src,
-                                "dst":        dst_ip,
-                                "last_2s":    bw_2s,
-                                "label":      label,
-                                "badge_class": badge_class
-                            })
-                    except:
-                        pass
-                    i += 2
-                else:
-                    i += 1
-
-            if iftop_list:
-                log_debug("SUCCESS", f"Parsed {len(iftop_list)} connections")
-            else:
-                log_debug("WARNING", "iftop returned no connection pairs")
-
-        except subprocess.TimeoutExpired:
-            log_debug("WARNING", "iftop timed out")
-        except Exception as e:
-            log_debug("ERROR", f"iftop parse: {str(e)[:60]}")
-
-        # --- Processes ---
-        processes = get_processes()
-
-        # --- Devices ---
-        devices = get_connected_devices()
-        router_uptime = get_router_uptime()
+        # --- Uptime / processes / devices / iftop: refresh whichever were fetched ---
+        now = time.monotonic()
+        for name in due:
+            section = sections.get(name.upper().encode())
+            if section is not None:
+                value = _CACHED_SECTIONS[name][2](section)
+                if value is not None:
+                    _section_cache[name] = (now, value)
+        router_uptime = cached_section("uptime", "--")
+        processes = cached_section("processes", [])
+        devices, devices_online = cached_section("devices", ([], 0))
+        iftop_list = cached_section("iftop", [])
 
         return {
             "status":         "Online",
@@ -1314,31 +1725,152 @@ def get_router_data():
             "total_mbps":     total_mbps,
             "iftop":          iftop_list,
             "devices":        devices,
+            "devices_online": devices_online,
             "processes":      processes,
             "router_uptime":  router_uptime,
-            "time":           datetime.now().strftime("%H:%M:%S"),
-            "debug_logs":     list(debug_logs)
+            "time":           time.strftime("%H:%M:%S"),
+            "debug_logs":     debug_logs.snapshot()
         }
 
     except subprocess.TimeoutExpired:
         log_debug("ERROR", f"SSH timeout to {ROUTER_IP}")
-        return {"status": "Offline", "error": "Connection timeout", "debug_logs": list(debug_logs)}
+        return {"status": "Offline", "error": "Connection timeout", "debug_logs": debug_logs.snapshot()}
     except Exception as e:
         log_debug("ERROR", f"Query failed: {str(e)[:80]}")
-        return {"status": "Offline", "error": str(e), "debug_logs": list(debug_logs)}
+        return {"status": "Offline", "error": str(e), "debug_logs": debug_logs.snapshot()}
+
+
+def encode_json(payload):
+    """Serialise to bytes — orjson when it is installed (C, ~3-5x faster), else stdlib json."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+class Snapshot:
+    """
+    One published poll result, encoded once for every reader.
+
+    body  — full JSON payload, etag — short hash of body (for 304s)
+    patch — {"patch": {changed keys}} against the previous snapshot, or None
+            when the key set changed (e.g. Online -> Offline)
+    seq   — increments per publish; a stream client that sent seq - 1 can
+            apply the patch instead of receiving the whole body again
+    """
+    __slots__ = ("seq", "payload", "body", "etag", "patch", "_gzip_body")
+
+    def __init__(self, seq, payload, body, patch):
+        self.seq, self.payload, self.body, self.patch = seq, payload, body, patch
+        self.etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self._gzip_body = None
+
+    def gzip_body(self):
+        """body gzipped on first request, then reused until the next poll."""
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body, 6)
+        return self._gzip_body
+
+
+def publish_snapshot(payload):
+    """Encode a poll result (and its delta from the last one) and swap it in."""
+    global _snapshot
+    prev, patch = _snapshot, None
+    if prev is not None and prev.payload.keys() == payload.keys():
+        # Shallow diff — devices and processes often come back unchanged
+        patch = encode_json({"patch": {k: v for k, v in payload.items() if prev.payload[k] != v}})
+    _snapshot = Snapshot(prev.seq + 1 if prev else 0, payload, encode_json(payload), patch)
+    with _snapshot_ready:
+        _snapshot_ready.notify_all()
+
+
+publish_snapshot({"status": "Offline", "error": "Waiting for first poll", "debug_logs": []})
+
+
+def _poll_loop():
+    """Producer: rebuild the shared snapshot every POLL_INTERVAL seconds."""
+    while True:
+        started = time.monotonic()
+        try:
+            publish_snapshot(get_router_data())
+        except Exception as e:
+            log_debug("ERROR", f"Poller: {str(e)[:60]}")
+        time.sleep(max(0.0, POLL_INTERVAL - (time.monotonic() - started)))
+
+
+def start_poller():
+    """Start the background poller so /api/stats never waits on SSH."""
+    threading.Thread(target=_poll_loop, name="router-poller", daemon=True).start()
 
 
 # ---------------------------------------------------------------------------
 # FLASK ROUTES
 # ---------------------------------------------------------------------------
 
+def cached_response(body, gzip_body, etag, mimetype, cache_control):
+    """
+    Response for a pre-encoded body: gzipped when the client accepts it, with
+    an ETag (one per encoding) so a matching If-None-Match gets an empty 304.
+    """
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if request.accept_encodings["gzip"] > 0:    # quality, so "gzip;q=0" is a refusal
+        body, etag = gzip_body(), etag + "-gz"
+        headers["Content-Encoding"] = "gzip"
+    resp = Response(body, mimetype=mimetype, headers=headers)
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE, INTERFACE=INTERFACE)
+    return cached_response(_INDEX_HTML, lambda: _INDEX_GZIP, _INDEX_ETAG, "text/html", "max-age=3600")
 
 @app.route('/api/stats')
 def api_stats():
-    return jsonify(get_router_data())
+    # Serve the poller's latest snapshot — HTTP cadence and browser count no
+    # longer drive how often we SSH into the router.  The body was encoded
+    # once by the poller and is gzipped at most once per snapshot.
+    snap = _snapshot
+    return cached_response(snap.body, snap.gzip_body, snap.etag, "application/json", "no-cache")
+
+@app.route('/api/stream')
+def api_stream():
+    """
+    Server-Sent Events: push every new poller snapshot down one long-lived
+    connection instead of the browser re-requesting /api/stats on a timer.
+    The first frame is the full payload; after that only the changed keys
+    are sent while the client is exactly one snapshot behind, with a full
+    resync every STREAM_FULL_SYNC seconds.  Each stream pins a server thread,
+    so past MAX_STREAMS the client gets a 503 and polls /api/stats instead.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        log_debug("WARNING", f"Stream limit ({MAX_STREAMS}) reached, client falls back to polling")
+        return jsonify({"error": "Too many open streams"}), 503
+
+    def events():
+        last, full_at = None, 0.0
+        while True:
+            snap = _snapshot
+            if snap is last:
+                with _snapshot_ready:
+                    _snapshot_ready.wait_for(lambda: _snapshot is not last, timeout=15)
+                snap = _snapshot
+                if snap is last:
+                    # Idle: a comment line keeps proxies open and lets a
+                    # write to a closed socket end this generator.
+                    yield b": keepalive\n\n"
+                    continue
+            if (last is not None and snap.patch is not None and snap.seq == last.seq + 1
+                    and time.monotonic() - full_at < STREAM_FULL_SYNC):
+                yield b"data: " + snap.patch + b"\n\n"
+            else:
+                full_at = time.monotonic()
+                yield b"data: " + snap.body + b"\n\n"
+            last = snap
+
+    resp = Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    resp.call_on_close(_stream_slots.release)
+    return resp
 
 @app.route('/api/debug/clear')
 def clear_debug():
@@ -1346,20 +1878,33 @@ def clear_debug():
     log_debug("INFO", "Debug log cleared")
     return jsonify({"status": "cleared"})
 
+def _watch_flush(proc):
+    """Report how a dispatched DHCP flush ended, off the request thread."""
+    try:
+        code = proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        log_debug("ERROR", "DHCP flush timed out")
+        return
+    if code == 0:
+        log_debug("SUCCESS", "DHCP leases flushed — dnsmasq restarted")
+        _section_cache.pop("devices", None)   # force a fresh scan on the next poll
+    else:
+        log_debug("ERROR", f"DHCP flush failed (exit {code})")
+
+
 @app.route('/api/action/flush-dhcp', methods=['POST'])
 def action_flush_dhcp():
-    """Clear DHCP leases on the router without restarting it."""
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
+    """Clear DHCP leases on the router without restarting it (non-blocking)."""
     try:
         log_debug("WARNING", "Flushing DHCP leases...")
         # Remove the lease file and signal dnsmasq to reload
-        cmd = (f'{ssh_base} "'
-               f'> /tmp/dhcp.leases; '
-               f'/etc/init.d/dnsmasq restart'
-               f'"')
-        subprocess.check_output(cmd, shell=True, timeout=10)
-        log_debug("SUCCESS", "DHCP leases flushed — dnsmasq restarted")
-        return jsonify({"message": "✓ DHCP leases flushed successfully"})
+        proc = subprocess.Popen(
+            _SSH_ARGS + ["> /tmp/dhcp.leases; /etc/init.d/dnsmasq restart"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        threading.Thread(target=_watch_flush, args=(proc,), name="dhcp-flush", daemon=True).start()
+        return jsonify({"message": "✓ DHCP flush sent — dnsmasq restarting"})
     except Exception as e:
         log_debug("ERROR", f"DHCP flush failed: {str(e)[:60]}")
         return jsonify({"error": f"Flush failed: {str(e)[:60]}"}), 500
@@ -1367,13 +1912,12 @@ def action_flush_dhcp():
 @app.route('/api/action/reboot', methods=['POST'])
 def action_reboot():
     """Reboot the router (non-blocking — fire and forget)."""
-    ssh_base = f"ssh -o ConnectTimeout=3 -o BatchMode=yes root@{ROUTER_IP}"
     try:
         log_debug("WARNING", "Router reboot requested...")
         # Use sleep 1 so the SSH session has time to close cleanly before the reboot fires
         subprocess.Popen(
-            f'{ssh_base} "sleep 1 && reboot"',
-            shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            _SSH_ARGS + ["sleep 1 && reboot"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
         log_debug("SUCCESS", "Reboot command sent — router rebooting...")
         return jsonify({"message": "✓ Reboot command sent — router is rebooting"})
@@ -1389,4 +1933,12 @@ if __name__ == '__main__':
     log_debug("INFO",    "Router Monitor V7 starting...")
     log_debug("SUCCESS", f"Monitoring {ROUTER_IP} on {INTERFACE}")
     log_debug("INFO",    f"iftop tracking on {LAN_INTERFACE} with traffic classification")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    prime_ssh_master()
+    start_poller()
+    if waitress is not None:
+        # Each open dashboard holds one thread on /api/stream (at most
+        # MAX_STREAMS), so the rest of the pool stays free for the stats,
+        # page and action requests alongside them.
+        waitress.serve(app, host='0.0.0.0', port=5000, threads=SERVER_THREADS, connection_limit=100)
+    else:
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)